@@ -1,45 +1,257 @@
 import re
+import threading
+import time
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Dict, Tuple, Optional
+from typing import Callable, Dict, NamedTuple, Tuple, Optional
 
-from models import DetectedIntent
+from models import DetectedIntent, SessionFacts
 from ticketing import get_or_create_customer, create_ticket, append_message, find_open_ticket_by_order
 from db import get_conn, get_order_status
 from policy import normalize_issue, is_allowed
 import llm
 from manual import get_manual_fuzzy, upsert_manual
+from config import settings
 
-# ----------------------------- Globals & Regex -----------------------------
-SESSION_CACHE: Dict[str, Dict] = {}
-
-EMAIL_RE = re.compile(r"\b[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}\b", re.I)
-ORDER_ID_RE    = re.compile(r"(order[ _-]?id[: ]*)(ORDL[0-9A-Z-]{1,})", re.I)
-ORDER_TOKEN_RE = re.compile(r"\b(ORDL[0-9A-Z-]{1,})\b", re.I)
+# ----------------------------- LLM Hooks -----------------------------
+# Resolved once at import; an optional hook llm.py doesn't provide is None and its caller falls back.
+_llm_rewrite = getattr(llm, "rewrite_answer", None)
+_llm_welcome = getattr(llm, "welcome_message", None)
+_llm_classify = getattr(llm, "classify", None)
+_llm_manual_route = getattr(llm, "manual_route", None)
+_llm_detect_manual = getattr(llm, "detect_manual_request", None)
 
-END_TOKENS = ("no thanks","nothing","that's all","that is all","all good","i'm good","im good","nope","nah")
-THANKS_TOKENS = ("thanks","thank you")
+# ----------------------------- Globals & Regex -----------------------------
+class _SessionCache:
+    """
+    Bounded, thread-safe session store.
+    Entries are kept in last-access order: anything idle longer than `ttl` seconds
+    is dropped, and the least recently used entries go once `maxsize` is exceeded.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, SessionFacts]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        while self._data:
+            oldest = next(iter(self._data.values()))
+            if len(self._data) <= self.maxsize and now - oldest[0] <= self.ttl:
+                break
+            self._data.popitem(last=False)
+
+    def get_or_create(self, key: str, factory: Callable[[], SessionFacts]) -> SessionFacts:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.pop(key, None)
+            value = hit[1] if hit and now - hit[0] <= self.ttl else factory()
+            self._data[key] = (now, value)
+            self._evict(now)
+            return value
+
+    def pop(self, key: str, default=None):
+        with self._lock:
+            hit = self._data.pop(key, None)
+        return hit[1] if hit else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+SESSION_CACHE = _SessionCache(settings.SESSION_CACHE_MAX, settings.SESSION_TTL_SECONDS)
+
+# EMAIL_RE and ORDER_ANY_RE also run over whole email bodies (gmail_ack), so they use RE2
+# (linear time, no backtracking) when google-re2 is installed. Everything else stays on stdlib
+# re: on chat-sized text the RE2 wrapper costs more per call than it saves.
+# RE2's module takes no flag arguments, so patterns compiled with it carry inline flags.
+try:
+    import re2 as _fast_re
+except ImportError:
+    _fast_re = re
+
+# Bounded parts and dot-separated domain labels keep matching linear on long pasted text.
+EMAIL_RE = _fast_re.compile(r"(?i)\b[A-Z0-9._%+-]{1,64}@(?:[A-Z0-9](?:[A-Z0-9-]{0,62}[A-Z0-9])?\.){1,8}[A-Z]{2,24}\b")
+# Order ids are short: a longer ORDL token is skipped as a whole (never cut down to a prefix).
+_ORDL = r"ORDL[0-9A-Z-]+"
+_ORDER_ID_MAX_LEN = 36
+# Use with .match(): a labelled "order id: ORDL…" anywhere in the text wins (group 1),
+# otherwise the first bare ORDL token (group 2) — one call instead of search + findall.
+ORDER_ANY_RE   = _fast_re.compile(rf"(?is).*?order[ _-]?id[: ]*({_ORDL})|.*?\b({_ORDL})\b")
+# The same two forms one at a time, for stepping past over-long candidates.
+_ORDER_LABELLED_RE = _fast_re.compile(rf"(?i)order[ _-]?id[: ]*({_ORDL})")
+_ORDER_BARE_RE     = _fast_re.compile(rf"(?i)\b({_ORDL})\b")
+
+# A message that is nothing but an order id, optionally wrapped in whitespace/punctuation.
+# Same result as strip() + strip(punct) + a full match of \b(ORDL…)\b, in one call
+# (stdlib re, so \s agrees with str.strip()).
+_BARE_PUNCT = r"[ .,:;!?\n\t\r\"'`()\[\]{}]*"
+_BARE_ORDER_RE = re.compile(rf"(?i)\s*{_BARE_PUNCT}({_ORDL})\b{_BARE_PUNCT}\s*")
+
+# Closing replies: single words must match a whole token ("nah" is not in "savannah"),
+# multi-word phrases are matched as substrings.
+END_WORDS = frozenset({"nothing","nope","nah"})
+END_PHRASES = ("no thanks","that's all","that is all","all good","i'm good","im good")
+THANKS_WORDS = frozenset({"thanks"})
+THANKS_PHRASES = ("thank you",)
 GREET_TOKENS = ("hi","hello","hey","hola","yo","good morning","good afternoon","good evening")
 
-STOP = {
+STOP = frozenset({
     "the","a","an","and","or","to","for","of","in","on","is","are","i","my","me","it",
     "this","that","with","was","had","have","has","please","hi","hello","hey"
-}
+})
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
 OPEN_TICKET_TOKENS = (
     "open a ticket","open ticket","raise a ticket","raise ticket",
     "create a ticket","create ticket","register complaint","file a complaint"
 )
 
-# ----------------------------- Helpers -----------------------------
-def _tokens(text: str):
-    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP]
+# Intent keyword groups (matched as plain substrings of the lowercased text)
+DEFECT_TOKENS = ("defect","defective","broken","damage","damaged")
+WRONG_ITEM_TOKENS = (
+    "wrong item","wrong product","not what i ordered","received different","received a different",
+    "different brand","mismatch","mismatched","incorrect item","wrong "
+)
+MISSING_ITEM_TOKENS = (
+    "missing item","item missing","one item missing","not received","not delivered","partial delivery"
+)
+HUMAN_TOKENS = (
+    "talk to a human","talk to human","talk to agent","human agent","human support","human assistance",
+    "need human assistance","human help","need human help","connect me to a human","connect to human",
+    "connect to agent","support person","representative","customer care","customer support","escalate",
+    "escalation","call me","phone call","need a call","speak to someone","speak with someone","speak to a person"
+)
+HUMAN_NOUNS = ("human","agent","representative")
+HUMAN_VERBS = ("help","assist","assistance","support","talk","speak","connect","call")
+BYE_TOKENS = ("bye","goodbye","bye bye","see you","cya","end chat","close chat","finish chat",
+              "stop","exit","quit","no thanks that's all","that's all","that is all")
+FAQ_TRIGGERS = (
+    "return policy","return","exchange","refund","delivery time","shipping","track","tracking","cancel","cancellation",
+    "address change","address","cod","cash on delivery","payment","payment failed","failed payment","money debited",
+    "debited","charged","double charged","transaction","paid","invoice","gst","bill","billing","warranty","size",
+    "fit","size chart","missing","not received","partial"
+)
+# Any of these means the user already described an issue alongside the order id.
+ISSUE_HINT_TOKENS = (
+    "defect","broken","damaged","wrong","missing","not received","partial","refund","return","exchange",
+    "payment","charged","debited","invoice","tracking","cancel","address","size","warranty"
+)
 
-def _contains_phrase(text: str, phrase: str) -> bool:
-    return re.search(rf"\b{re.escape(phrase)}\b", text, flags=re.I) is not None
+def _alt(phrases) -> str:
+    return "|".join(re.escape(p) for p in sorted(set(phrases), key=len, reverse=True))
+
+def _alternation(phrases):
+    """One compiled scan for 'any phrase occurs in text' (longest phrases first)."""
+    return re.compile(_alt(phrases))
+
+def _has_any(t: str, phrases) -> bool:
+    """True if any phrase is a substring of t (plain loop: cheaper than a genexpr or a regex here)."""
+    for p in phrases:
+        if p in t:
+            return True
+    return False
+
+def _first_group_table(groups):
+    """Flatten ordered (name, phrases) groups into (phrase, name) pairs, keeping group order."""
+    return tuple((p, name) for name, phrases in groups for p in phrases)
+
+def _first_group(table, t: str) -> Optional[str]:
+    """Name of the FIRST group (in declaration order, not text position) with a phrase in t."""
+    for p, name in table:
+        if p in t:
+            return name
+    return None
+
+# Keyword groups in intent priority order; the first group with a hit wins.
+# (Plain substring checks: on chat-sized text they beat any compiled alternation.)
+_INTENT_GROUPS = _first_group_table((
+    ("defect", DEFECT_TOKENS),
+    ("wrong_item", WRONG_ITEM_TOKENS),
+    ("missing_item", MISSING_ITEM_TOKENS),
+    ("human", HUMAN_TOKENS),
+    ("bye", BYE_TOKENS),
+    ("faq", FAQ_TRIGGERS),
+))
+# Prebuilt results for messages without an order id, the common case.
+_INTENT_DISPATCH = {
+    "defect": DetectedIntent("defect", None, "Defective item"),
+    "wrong_item": DetectedIntent("wrong_item", None, "Received wrong item"),
+    "missing_item": DetectedIntent("missing_item", None, "Missing/partial delivery"),
+    "human": DetectedIntent("human", None, "Human assistance request"),
+    "bye": DetectedIntent("bye", None, None),
+    "greet": DetectedIntent("greet", None, None),
+    "faq": DetectedIntent("faq", None, None),
+    "fallback": DetectedIntent("fallback", None, None),
+}
+# Greetings are whole words/phrases ("hi" is not in "this"); stdlib re so \b stays Unicode-aware.
+_GREET_RE        = re.compile(r"\b(?:" + _alt(GREET_TOKENS) + r")\b", re.I)
+# One scan for every closing reply: words fenced like _tokens() splits them, phrases as substrings.
+# (lookbehind needs the stdlib engine)
+_CLOSING_RE      = re.compile(
+    "(?<![a-z0-9])(?:" + _alt(END_WORDS | THANKS_WORDS) + ")(?![a-z0-9])|" + _alt(END_PHRASES + THANKS_PHRASES)
+)
+
+# ----------------------------- Helpers -----------------------------
+def _tokens(text: str, text_lower: Optional[str] = None):
+    t = text.lower() if text_lower is None else text_lower
+    return [w for w in _TOKEN_RE.findall(t) if w not in STOP]
+
+def _first_order_id(text: str) -> Optional[str]:
+    """Order id for detect_intent: labelled ids first, then bare tokens, skipping over-long ones."""
+    m = ORDER_ANY_RE.match(text)
+    if not m:
+        return None
+    order_id = m.group(1) or m.group(2)
+    if len(order_id) <= _ORDER_ID_MAX_LEN:
+        return order_id
+    # rare: the first candidate is too long, so walk the rest in the same priority order
+    for rx in (_ORDER_LABELLED_RE, _ORDER_BARE_RE):
+        for m in rx.finditer(text):
+            if len(m.group(1)) <= _ORDER_ID_MAX_LEN:
+                return m.group(1)
+    return None
 
 def _is_bare_order_message(text: str) -> Optional[str]:
-    t = text.strip().strip(" .,:;!?\n\t\r\"'`()[]{}")
-    m = ORDER_TOKEN_RE.fullmatch(t)
-    return m.group(1).upper() if m else None
+    m = _BARE_ORDER_RE.fullmatch(text)
+    if not m or len(m.group(1)) > _ORDER_ID_MAX_LEN:
+        return None
+    return m.group(1).upper()
+
+# Light synonym expansion for spec questions (works for many categories, not just electronics)
+SPEC_SYNONYMS = {
+    "wifi": ["wi-fi", "wi fi", "wlan", "802.11", "80211"],
+    "throughput": ["speed", "bandwidth", "rate", "mbps", "gbps"],
+    "ports": ["port", "connector", "interface", "slot", "lan", "wan", "ethernet", "usb", "hdmi", "displayport", "audio", "jack"],
+    "power": ["voltage", "amp", "amps", "amperage", "watt", "watts", "adapter", "input", "battery", "psu"],
+    "dimensions": ["size", "measurement", "measurements", "width", "height", "depth", "length", "mm", "cm", "inch", "inches", "kg", "g", "weight"],
+    "warranty": ["guarantee", "support", "rma"],
+    "material": ["fabric", "steel", "stainless", "plastic", "aluminum", "wood", "leather", "cotton", "polyester"],
+    "capacity": ["volume", "storage", "ml", "l", "litre", "liter", "gb", "tb"],
+    "color": ["colour", "finish", "shade"],
+    "care": ["wash", "washing", "maintenance", "clean", "hand-wash", "dishwasher"],
+    "app": ["application", "android", "ios", "mobile"],
+    "security": ["encryption", "wpa", "wpa2", "wpa3", "tls"],
+}
+
+def _synonym_index(groups) -> Dict[str, frozenset]:
+    """word -> every word of each synonym group it belongs to (the key included)."""
+    index: Dict[str, set] = {}
+    for key, syns in groups.items():
+        group = {key, *syns}
+        for w in group:
+            index.setdefault(w, set()).update(group)
+    return {w: frozenset(g) for w, g in index.items()}
+
+_SYN_INDEX = _synonym_index(SPEC_SYNONYMS)
+
+_SPEC_TOKEN_RE = re.compile(r"[a-z0-9\.\-/]+")   # keeps "802.11", "wi-fi", "a/b" whole
+
+@lru_cache(maxsize=256)
+def _spec_matcher(tokens: frozenset):
+    """One substring scan for 'any of these spec tokens occurs'."""
+    return _alternation(tokens)
 
 def _extract_specs_subset(section_md: str, user_text: str, product_facts: Optional[dict] = None) -> Optional[str]:
     """
@@ -51,48 +263,25 @@ def _extract_specs_subset(section_md: str, user_text: str, product_facts: Option
     # --- normalize + tokenize ---
     q = " " + user_text.lower().strip() + " "
     # very small stoplist; reuse your STOP but allow numbers/units to pass through
-    q_tokens = [w for w in re.findall(r"[a-z0-9\.\-/]+", q) if w and w not in STOP]
-
-    # Light synonym expansion (works for many categories, not just electronics)
-    SYN = {
-        "wifi": ["wi-fi", "wi fi", "wlan", "802.11", "80211"],
-        "throughput": ["speed", "bandwidth", "rate", "mbps", "gbps"],
-        "ports": ["port", "connector", "interface", "slot", "lan", "wan", "ethernet", "usb", "hdmi", "displayport", "audio", "jack"],
-        "power": ["voltage", "amp", "amps", "amperage", "watt", "watts", "adapter", "input", "battery", "psu"],
-        "dimensions": ["size", "measurement", "measurements", "width", "height", "depth", "length", "mm", "cm", "inch", "inches", "kg", "g", "weight"],
-        "warranty": ["guarantee", "support", "rma"],
-        "material": ["fabric", "steel", "stainless", "plastic", "aluminum", "wood", "leather", "cotton", "polyester"],
-        "capacity": ["volume", "storage", "ml", "l", "litre", "liter", "gb", "tb"],
-        "color": ["colour", "finish", "shade"],
-        "care": ["wash", "washing", "maintenance", "clean", "hand-wash", "dishwasher"],
-        "app": ["application", "android", "ios", "mobile"],
-        "security": ["encryption", "wpa", "wpa2", "wpa3", "tls"],
-    }
+    q_tokens = [w for w in _SPEC_TOKEN_RE.findall(q) if w and w not in STOP]
+
+    # synonym expansion: one index probe per token
     expanded = set(q_tokens)
-    for tok in list(q_tokens):
-        for key, syns in SYN.items():
-            if tok == key or tok in syns:
-                expanded.add(key)
-                expanded.update(syns)
-    q_tokens = expanded
+    for tok in q_tokens:
+        group = _SYN_INDEX.get(tok)
+        if group:
+            expanded |= group
+    if not expanded:
+        return None   # nothing to look for → no filtering
+    hits = _spec_matcher(frozenset(expanded))
 
     # --- pass 1: pick relevant lines from markdown ---
-    lines = section_md.splitlines()
+    # A token inside a **Label:** is also on its line, so one scan per line decides;
+    # one scan over the whole section first skips sections that mention none of them.
+    low_md = section_md.lower()
     kept = []
-    for ln in lines:
-        low = " " + ln.lower() + " "
-        # Prefer matches in bold labels like **Label:**
-        score = 0
-        m = re.search(r"\*\*([^*]+?)\*\*\s*:", ln)
-        if m:
-            label = " " + m.group(1).lower() + " "
-            if any(tok in label for tok in q_tokens):
-                score += 2
-        # Otherwise match anywhere on the line
-        if any(tok in low for tok in q_tokens):
-            score += 1
-        if score > 0:
-            kept.append(ln)
+    if hits.search(low_md):
+        kept = [ln for ln, low in zip(section_md.splitlines(), low_md.splitlines()) if hits.search(low)]
 
     if kept:
         return "# Requested details\n" + "\n".join(kept)
@@ -102,7 +291,7 @@ def _extract_specs_subset(section_md: str, user_text: str, product_facts: Option
         synth = []
         for k, v in product_facts.items():
             label = str(k).replace("_", " ").lower()
-            if any(tok in (" " + label + " ") for tok in q_tokens):
+            if hits.search(label):
                 synth.append(f"- **{label.title()}:** {v}")
         if synth:
             return "# Requested details\n" + "\n".join(synth)
@@ -111,138 +300,186 @@ def _extract_specs_subset(section_md: str, user_text: str, product_facts: Option
     return None
 
 # ----------------------------- FAQ Cache -----------------------------
-@lru_cache(maxsize=1)
-def _load_faqs():
+def _phrase_scanner(phrases):
+    """
+    One pass over the query finds every phrase that occurs in it.
+    The lookahead reports the longest phrase starting at each position; any shorter
+    phrase starting there is a prefix of it, so `covers` maps each phrase to all
+    phrases contained in it (itself included) to recover those hits too.
+    """
+    if not phrases:
+        return None, {}
+    # lookahead needs the stdlib engine (RE2 has no lookaround)
+    scanner = re.compile("(?=(" + _alt(phrases) + "))")
+    covers = {p: tuple(o for o in phrases if o in p) for p in phrases}
+    return scanner, covers
+
+class _FaqIndex(NamedTuple):
+    """
+    FAQ snapshot in columnar form:
+      - questions / answers: parallel tuples indexed by FAQ position
+      - token_index: single-word keyword -> FAQ positions (one entry per occurrence)
+      - phrase_index: multi-word keyword -> FAQ positions, matched as substrings
+      - phrase_scanner / phrase_covers: see _phrase_scanner
+    """
+    questions: Tuple[str, ...]
+    answers: Tuple[str, ...]
+    token_index: Dict[str, list]
+    phrase_index: Dict[str, list]
+    phrase_scanner: Optional[re.Pattern]
+    phrase_covers: Dict[str, tuple]
+
+def _build_faqs() -> _FaqIndex:
     with get_conn() as conn:
         rows = conn.execute(
             "SELECT id, question, answer, COALESCE(keywords,'') AS keywords FROM faq"
         ).fetchall()
-    faqs = []
-    for r in rows:
-        kws = [k.strip() for k in r["keywords"].lower().split(",") if k.strip()]
-        faqs.append({"id": r["id"], "question": r["question"], "answer": r["answer"], "keywords": kws})
+    questions, answers = [], []
+    token_index: Dict[str, list] = {}
+    phrase_index: Dict[str, list] = {}
+    for i, r in enumerate(rows):
+        questions.append(r["question"])
+        answers.append(r["answer"])
+        for kw in (k.strip() for k in r["keywords"].lower().split(",")):
+            if not kw:
+                continue
+            index = phrase_index if " " in kw else token_index
+            index.setdefault(kw, []).append(i)
+    scanner, covers = _phrase_scanner(list(phrase_index))
+    return _FaqIndex(tuple(questions), tuple(answers), token_index, phrase_index, scanner, covers)
+
+# Current snapshot; readers take the reference without locking, refresh just rebinds it.
+_FAQS: Optional[_FaqIndex] = None
+
+def _load_faqs() -> _FaqIndex:
+    global _FAQS
+    faqs = _FAQS
+    if faqs is None:
+        faqs = _FAQS = _build_faqs()
     return faqs
 
 def refresh_faq_cache():
-    _load_faqs.cache_clear()
-
-def answer_faq_from_db(query: str) -> Optional[tuple[str, str]]:
-    q = query.lower()
-    toks = set(_tokens(query))
-    best = None
-    best_score = 0.0
-    for f in _load_faqs():
-        score = 0.0
-        for kw in f["keywords"]:
-            if not kw:
-                continue
-            if " " in kw and kw in q:
-                score += 2.0
-            elif kw in toks:
-                score += 1.0
-        if score > best_score:
-            best, best_score = f, score
-    if best and best_score >= 1.0:
-        return best["answer"], best["question"]
-    return None
+    global _FAQS
+    _FAQS = None
+    _best_faq.cache_clear()
+    _faq_lookup.cache_clear()
+
+def warm_faq_cache():
+    """Load the FAQ snapshot up front (after init_db) so the first chat turn skips the DB read."""
+    _load_faqs()
+
+# Memoized helpers only cache chat-sized text: long pastes and whole email bodies (gmail_ack)
+# never repeat, so caching them would just fill the caches.
+_MEMO_MAX_LEN = 280
+
+def answer_faq_from_db(query: str, text_lower: Optional[str] = None) -> Optional[tuple[str, str]]:
+    q = query.lower() if text_lower is None else text_lower
+    return _best_faq(q) if len(q) <= _MEMO_MAX_LEN else _score_faq(q)
+
+def _score_faq(q: str) -> Optional[tuple[str, str]]:
+    # A bare order id ("ORDL123", e.g. answering "what's your order id?") is never an FAQ query.
+    if "ordl" in q and _is_bare_order_message(q):
+        return None
+    faqs = _load_faqs()
+    # Sparse integer scores: only FAQs hit by a keyword get an entry (token +1, phrase +2).
+    scores: Dict[int, int] = {}
+    for tok in set(_tokens(q, q)):
+        for i in faqs.token_index.get(tok, ()):
+            scores[i] = scores.get(i, 0) + 1
+    # every phrase keyword contains a space, so a one-word query can't hit any
+    if faqs.phrase_scanner is not None and " " in q:
+        found = set()
+        for longest in set(faqs.phrase_scanner.findall(q)):
+            found.update(faqs.phrase_covers[longest])
+        for phrase in found:
+            for i in faqs.phrase_index[phrase]:
+                scores[i] = scores.get(i, 0) + 2
+    if not scores:
+        return None
+    # every entry scores >= 1; ties go to the earliest FAQ
+    best = max(scores, key=lambda i: (scores[i], -i))
+    return faqs.answers[best], faqs.questions[best]
+
+# Scores depend only on the lowercased query (and the FAQ snapshot, cleared together).
+_best_faq = lru_cache(maxsize=4096)(_score_faq)
 
 # ----------------------------- Intent Detection -----------------------------
-def detect_intent(text: str) -> DetectedIntent:
-    t = text.lower()
-    order_id = None
-    m = ORDER_ID_RE.search(text)
-    if m:
-        order_id = m.group(2).strip()
-    else:
-        fallback = ORDER_TOKEN_RE.findall(text)
-        if fallback:
-            order_id = fallback[0]
-
-    if any(k in t for k in ["defect","defective","broken","damage","damaged"]):
-        return DetectedIntent("defect", order_id, "Defective item")
-    if ("wrong item" in t or "wrong product" in t or "not what i ordered" in t
-        or "received different" in t or "received a different" in t
-        or "different brand" in t or "mismatch" in t or "mismatched" in t
-        or "incorrect item" in t or "wrong " in t):
-        return DetectedIntent("wrong_item", order_id, "Received wrong item")
-    if ("missing item" in t or "item missing" in t or "one item missing" in t
-        or "not received" in t or "not delivered" in t or "partial delivery" in t
-        or ("missing" in t and "item" in t)):
-        return DetectedIntent("missing_item", order_id, "Missing/partial delivery")
-
-    HUMAN_TOKENS = (
-        "talk to a human","talk to human","talk to agent","human agent","human support","human assistance",
-        "need human assistance","human help","need human help","connect me to a human","connect to human",
-        "connect to agent","support person","representative","customer care","customer support","escalate",
-        "escalation","call me","phone call","need a call","speak to someone","speak with someone","speak to a person"
-    )
-    if any(tok in t for tok in HUMAN_TOKENS) or (
-        (("human" in t) or ("agent" in t) or ("representative" in t)) and
-        ("help" in t or "assist" in t or "assistance" in t or "support" in t or
-         "talk" in t or "speak" in t or "connect" in t or "call" in t)
-    ):
-        return DetectedIntent("human", order_id, "Human assistance request")
-
-    BYE_TOKENS = ("bye","goodbye","bye bye","see you","cya","end chat","close chat","finish chat",
-                  "stop","exit","quit","no thanks that's all","that's all","that is all")
-    if any(tok in t for tok in BYE_TOKENS) or ("thanks" in t and "bye" in t):
-        return DetectedIntent("bye", order_id, None)
-
-    if any(_contains_phrase(t, g) for g in GREET_TOKENS):
-        return DetectedIntent("greet", order_id, None)
-
-    FAQ_TRIGGERS = (
-        "return policy","return","exchange","refund","delivery time","shipping","track","tracking","cancel","cancellation",
-        "address change","address","cod","cash on delivery","payment","payment failed","failed payment","money debited",
-        "debited","charged","double charged","transaction","paid","invoice","gst","bill","billing","warranty","size",
-        "fit","size chart","missing","not received","partial"
-    )
-    if any(k in t for k in FAQ_TRIGGERS):
-        return DetectedIntent("faq", order_id, None)
-
-    return DetectedIntent("fallback", order_id, None)
+def detect_intent(text: str, text_lower: Optional[str] = None) -> DetectedIntent:
+    """`text_lower` lets callers that already lowercased the text skip doing it again."""
+    t = text.lower() if text_lower is None else text_lower
+    order_id = _first_order_id(text) if "ordl" in t else None
+
+    hit = _first_group(_INTENT_GROUPS, t) or "fallback"
+    # The compound and word-bounded rules slot in between _INTENT_GROUPS' entries.
+    if hit not in ("defect", "wrong_item", "missing_item"):
+        if "missing" in t and "item" in t:
+            hit = "missing_item"
+        elif hit != "human" and _has_any(t, HUMAN_NOUNS) and _has_any(t, HUMAN_VERBS):
+            hit = "human"
+        elif hit in ("faq", "fallback") and _GREET_RE.search(t):
+            hit = "greet"
+    intent = _INTENT_DISPATCH[hit]
+    if order_id is None:
+        return intent
+    return DetectedIntent(intent.type, order_id, intent.issue_summary)
+
+# Pure function of its arguments, so repeated chat messages ("hi", "refund?", an order id) can
+# share a result; only chat-sized text is cached (see _MEMO_MAX_LEN).
+_detect_intent_cached = lru_cache(maxsize=4096)(detect_intent)
+
+def _detect_chat_intent(text: str, text_lower: str) -> DetectedIntent:
+    if len(text) <= _MEMO_MAX_LEN:
+        return _detect_intent_cached(text, text_lower)
+    return detect_intent(text, text_lower)
 
 # ----------------------------- FAQ Answers -----------------------------
-def answer_faq(question: str) -> str:
-    t = question.lower()
-    if "return" in t or "exchange" in t:
-        return ("Returns: 30 days if unused and in original packaging. "
-                "Exchanges are subject to stock availability. Start from Orders → Return/Exchange.")
-    if "refund" in t:
-        return ("Refunds: issued to your original payment method within 5–7 business days "
-                "after we receive and inspect the item.")
-    if "delivery" in t or "shipping" in t:
-        return ("Shipping: we dispatch in 24–48 hours; delivery is usually 2–5 business days "
-                "depending on your location. You’ll get a tracking link by email/SMS.")
-    if "track" in t or "tracking" in t:
-        return ("Tracking: use the tracking link in your email/SMS. If you don’t have it, "
-                "share your Order ID (starts with ORDL) and we’ll fetch it for you.")
-    if "cancel" in t or "cancellation" in t:
-        return ("Cancellation: allowed until the order is packed/shipped. If it’s already shipped, "
-                "please refuse delivery or create a return after it arrives.")
-    if "address" in t or "change address" in t:
-        return ("Address change: possible before dispatch.")
-    if "cod" in t or "cash on delivery" in t:
-        return ("Cash on Delivery: available on eligible pin codes and order totals under the COD limit.")
-    if "payment" in t or "paid" in t or "failed" in t or "debited" in t or "charged" in t:
-        return ("Payment issues: if your payment was debited but the order isn’t visible, "
-                "it’ll auto-refund in 5–7 business days.")
-    if "invoice" in t or "gst" in t or "bill" in t:
-        return ("Invoice: you can download it from the Orders page after the item ships. "
-                "For GST invoice, ensure GST details are added before placing the order.")
-    if "warranty" in t:
-        return ("Warranty: covered as per brand policy. Keep your invoice; brand service centers may ask for it.")
-    if "size" in t or "fit" in t or "size chart" in t:
-        return ("Sizing: refer to the Size Chart on the product page. If it doesn’t fit, "
-                "you can request an exchange or return within 30 days.")
-    if "missing" in t or "not received" in t or "partial" in t:
-        return ("Missing items: sometimes multi-item orders arrive in separate boxes. "
-                "If something is still missing after the expected date, raise a ticket with your ORDL order ID.")
-    if "damaged" in t or "broken" in t:
-        return ("Damaged item: sorry about that! Please share photos and your ORDL order ID; "
-                "we’ll create a replacement/return right away.")
-    return ("Thanks! I’ve noted this. For order-specific help, please share your Order ID "
-            "(starts with ORDL), e.g., ORDL12345.")
+# First group (in this order) with a hit decides the canned answer.
+_FAQ_ANSWER_GROUPS = _first_group_table((
+    ("returns", ("return","exchange")),
+    ("refund", ("refund",)),
+    ("shipping", ("delivery","shipping")),
+    ("tracking", ("track","tracking")),
+    ("cancel", ("cancel","cancellation")),
+    ("address", ("address","change address")),
+    ("cod", ("cod","cash on delivery")),
+    ("payment", ("payment","paid","failed","debited","charged")),
+    ("invoice", ("invoice","gst","bill")),
+    ("warranty", ("warranty",)),
+    ("size", ("size","fit","size chart")),
+    ("missing", ("missing","not received","partial")),
+    ("damaged", ("damaged","broken")),
+))
+_FAQ_ANSWERS = {
+    "returns": ("Returns: 30 days if unused and in original packaging. "
+                "Exchanges are subject to stock availability. Start from Orders → Return/Exchange."),
+    "refund": ("Refunds: issued to your original payment method within 5–7 business days "
+               "after we receive and inspect the item."),
+    "shipping": ("Shipping: we dispatch in 24–48 hours; delivery is usually 2–5 business days "
+                 "depending on your location. You’ll get a tracking link by email/SMS."),
+    "tracking": ("Tracking: use the tracking link in your email/SMS. If you don’t have it, "
+                 "share your Order ID (starts with ORDL) and we’ll fetch it for you."),
+    "cancel": ("Cancellation: allowed until the order is packed/shipped. If it’s already shipped, "
+               "please refuse delivery or create a return after it arrives."),
+    "address": ("Address change: possible before dispatch."),
+    "cod": ("Cash on Delivery: available on eligible pin codes and order totals under the COD limit."),
+    "payment": ("Payment issues: if your payment was debited but the order isn’t visible, "
+                "it’ll auto-refund in 5–7 business days."),
+    "invoice": ("Invoice: you can download it from the Orders page after the item ships. "
+                "For GST invoice, ensure GST details are added before placing the order."),
+    "warranty": ("Warranty: covered as per brand policy. Keep your invoice; brand service centers may ask for it."),
+    "size": ("Sizing: refer to the Size Chart on the product page. If it doesn’t fit, "
+             "you can request an exchange or return within 30 days."),
+    "missing": ("Missing items: sometimes multi-item orders arrive in separate boxes. "
+                "If something is still missing after the expected date, raise a ticket with your ORDL order ID."),
+    "damaged": ("Damaged item: sorry about that! Please share photos and your ORDL order ID; "
+                "we’ll create a replacement/return right away."),
+}
+_FAQ_DEFAULT_ANSWER = ("Thanks! I’ve noted this. For order-specific help, please share your Order ID "
+                       "(starts with ORDL), e.g., ORDL12345.")
+
+def answer_faq(question: str, text_lower: Optional[str] = None) -> str:
+    hit = _first_group(_FAQ_ANSWER_GROUPS, question.lower() if text_lower is None else text_lower)
+    return _FAQ_ANSWERS[hit] if hit else _FAQ_DEFAULT_ANSWER
 
 def _polite(text: str) -> str:
     return text.strip() + "\n\nAnything else I can help with?"
@@ -250,7 +487,7 @@ def _polite(text: str) -> str:
 def compose_comment_reply(text: str) -> str:
     db = answer_faq_from_db(text)
     base = db[0] if db else answer_faq(text)
-    polished = getattr(llm, "rewrite_answer", lambda u, b: None)(text, base)
+    polished = _llm_rewrite(text, base) if _llm_rewrite else None
     return polished or _polite(base)
 
 # ----------------------------- Ticketing -----------------------------
@@ -276,14 +513,58 @@ def _create_or_append_ticket(
     return tid, True
 
 # ----------------------------- Manual Routing -----------------------------
-def _manual_route(text: str):
-    r = getattr(llm, "manual_route", None)
+# Unambiguous section names resolved without an LLM round-trip (anything else still goes to
+# llm.manual_route). "warranty" is left out on purpose: it is usually a policy FAQ.
+_SECTION_ALIASES = {
+    "tech specs": "tech_specs", "technical specs": "tech_specs", "specs": "tech_specs",
+    "specifications": "tech_specs", "technical specifications": "tech_specs",
+    "quick start": "quick_start", "quickstart": "quick_start", "setup guide": "quick_start",
+    "troubleshooting": "troubleshooting", "troubleshoot": "troubleshooting",
+}
+_SECTION_RE = re.compile(r"\b(" + _alt(_SECTION_ALIASES) + r")\b", re.I)
+_FOR_PRODUCT_RE = re.compile(r"\bfor\s+\S", re.I)
+# A plain manual request: the section word heads the message and "for <product>" ends it,
+# e.g. "tech specs for Router AX1800", "show me the troubleshooting guide for Acme Kettle".
+# The product is one clause (no , ; : ! ? or line breaks), so "troubleshooting for hours, still
+# stuck" is not one.
+_MANUAL_REQUEST_RE = re.compile(
+    r"\s*(?:(?:please\s+)?(?:show|get|send|give)(?:\s+me)?\s+)?(?:the\s+)?"
+    r"(" + _alt(_SECTION_ALIASES) + r")(?:\s+(?:guide|section|info))?"
+    r"\s+for\s+([^,;:!?\n]+?)[\s.!?]*",
+    re.I,
+)
+
+def _local_manual_route(text: str):
+    """
+    Keyword shortcut for manual requests; None leaves the message to the LLM router.
+      - plain "<section> for <product>" requests are routed with their product
+      - a section word with no "for <product>" after it is routed without one, so chat_turn
+        asks which product
+    """
+    m = _MANUAL_REQUEST_RE.fullmatch(text)
+    if m:
+        section = _SECTION_ALIASES.get(m.group(1).lower())
+        product = m.group(2).strip(" \t\"'")
+        return {"section": section, "product": product, "confidence": 0.9} if section and product else None
+    m = _SECTION_RE.search(text)
+    section = _SECTION_ALIASES.get(m.group(1).lower()) if m else None
+    if not section or _FOR_PRODUCT_RE.search(text, m.end()):
+        return None
+    return {"section": section, "product": None, "confidence": 0.9}
+
+def _manual_route(text: str, local: bool = False):
+    """`local` allows the keyword shortcut; chat_turn only sets it for messages no other flow claims."""
+    if local:
+        hit = _local_manual_route(text)
+        if hit:
+            return hit
+    r = _llm_manual_route
     if callable(r):
         try:
             return r(text)
         except Exception:
             pass
-    r2 = getattr(llm, "detect_manual_request", None)
+    r2 = _llm_detect_manual
     if callable(r2):
         try:
             sec, prod = r2(text)
@@ -293,49 +574,84 @@ def _manual_route(text: str):
             pass
     return None
 
+# Display names for the codes that can be refused at the current order stage.
+_PRETTY_ISSUE = {c: c.replace("_", " ").lower() for c in ("DEFECTIVE_ITEM", "WRONG_ITEM", "MISSING_ITEM")}
+
+def _pretty_issue(code: str) -> str:
+    return _PRETTY_ISSUE.get(code) or code.replace("_", " ").lower()
+
+def _truncate_md(md: str, limit: int, suffix: str) -> str:
+    """Cut over-long markdown at the last line break near `limit`, so a bullet isn't split mid-way."""
+    if len(md) <= limit:
+        return md
+    cut = md.rfind("\n", max(0, limit - 200), limit)
+    return md[:cut if cut > 0 else limit].rstrip() + suffix
+
+# ----------------------------- FAQ Replies -----------------------------
+# The FAQ lookup depends only on the message, not on session state, so repeats like
+# "refund?" skip scoring. Cleared together with the FAQ cache. The LLM rewrite is not
+# cached: it is sampled and may fail, and a failure must not stick to the message.
+@lru_cache(maxsize=1024)
+def _faq_lookup(user_text: str, text_lower: str) -> Tuple[str, str]:
+    """(raw answer, issue code) for chat_turn's FAQ branch."""
+    hit = answer_faq_from_db(user_text, text_lower)
+    if hit:
+        raw_ans, label = hit
+    else:
+        raw_ans = answer_faq(user_text, text_lower)
+        label = infer_issue_label_from_text(user_text, text_lower)
+    return raw_ans, normalize_issue(label)
+
+def _faq_reply(user_text: str, text_lower: str) -> Tuple[str, str]:
+    """(reply, issue code) for chat_turn's FAQ branch."""
+    lookup = _faq_lookup if len(user_text) <= _MEMO_MAX_LEN else _faq_lookup.__wrapped__
+    raw_ans, code = lookup(user_text, text_lower)
+    polished = (_llm_rewrite(user_text, raw_ans) if _llm_rewrite else None) or raw_ans
+    return (polished + "\n\nIf you’d like me to open a ticket for this, just say: “open a ticket for this issue”.",
+            code)
+
 # ----------------------------- Chat Turn -----------------------------
 def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name: Optional[str] = None) -> Tuple[str, Optional[int]]:
-    session = SESSION_CACHE.setdefault(session_id, {"facts": {}})
-    facts = session["facts"]
-    t = user_text.strip()
-    tl = t.lower()
+    facts = SESSION_CACHE.get_or_create(session_id, SessionFacts)
+    # lowercase once per turn; helpers take it via `text_lower`
+    raw_lower = user_text.lower()
+    tl = raw_lower.strip()
 
-    rep = facts.setdefault("_repeat", {"key": None, "count": 0})
     def _mark(reply_key: str) -> int:
-        if rep["key"] == reply_key: rep["count"] += 1
-        else: rep["key"], rep["count"] = reply_key, 1
-        return rep["count"]
+        if facts.repeat_key == reply_key: facts.repeat_count += 1
+        else: facts.repeat_key, facts.repeat_count = reply_key, 1
+        return facts.repeat_count
 
-    intent = detect_intent(user_text)
+    intent = _detect_chat_intent(user_text, raw_lower)
     if intent.order_id:
-        facts["order_id"] = intent.order_id
-    order_id = facts.get("order_id")
+        facts.order_id = intent.order_id
+    order_id = facts.order_id
 
     # Greets / Bye
     if intent.type == "greet":
         wm = None
         try:
-            wm = getattr(llm, "welcome_message", None)() if callable(getattr(llm, "welcome_message", None)) else None
+            wm = _llm_welcome() if callable(_llm_welcome) else None
         except Exception:
             wm = None
         return (wm or "Hello! I can help with orders (defective/wrong/missing), payments, refunds/returns, "
                       "delivery/tracking, cancellations, address changes, invoices, warranty and sizing."), None
 
-    if intent.type == "bye" or any(k in tl for k in END_TOKENS) or any(k in tl for k in THANKS_TOKENS):
+    if intent.type == "bye" or _CLOSING_RE.search(tl):
         SESSION_CACHE.pop(session_id, None)
         return "Alright — I’ll close this chat now. If you need anything later, just start a new one. 👋", None
 
     # Human email capture
-    if facts.get("awaiting_human_email"):
+    if facts.awaiting_human_email:
         m = EMAIL_RE.search(user_text)
         if not m:
             return "To connect you to a human, please share your email ID (e.g., name@example.com).", None
         contact_email = m.group(0)
         customer_id = get_or_create_customer(email=contact_email, name=name or "Chat User")
-        facts["customer_id"] = customer_id
-        facts["contact_email"] = contact_email
+        facts.customer_id = customer_id
+        facts.contact_email = contact_email
         tid, _ = _create_or_append_ticket(customer_id, order_id, "HUMAN_ASSISTANCE", f"[Human request] {contact_email}", "chat")
-        facts.pop("awaiting_human_email", None)
+        facts.awaiting_human_email = False
         return (f"Okay, I’ve requested a human agent. Ticket #{tid}"
                 + (f" for Order {order_id}." if order_id else ".")
                 + f" We’ll reach out to {contact_email} shortly."), tid
@@ -343,22 +659,22 @@ def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name
     # Bare ORDL short-circuit
     bare_order = _is_bare_order_message(user_text)
     if bare_order:
-        facts["order_id"] = bare_order
+        facts.order_id = bare_order
         order_id = bare_order
-        last_code = facts.get("last_issue_code")
-        pending_msg = facts.get("pending_issue_text") or "Auto-created from prior complaint."
+        last_code = facts.last_issue_code
+        pending_msg = facts.pending_issue_text or "Auto-created from prior complaint."
         if last_code:
             status = get_order_status(order_id)
             if not status:
                 return f"I captured **{order_id}**, but I couldn’t find it in our system. Please double-check the ID.", None
             if not is_allowed(last_code, status):
-                pretty = last_code.replace("_"," ").lower()
+                pretty = _pretty_issue(last_code)
                 return (f"Order {order_id} is **{status}**. *{pretty}* isn’t available at this stage. "
                         "I can connect you to a human or suggest alternatives (e.g., return/refund)."), None
-            customer_id = facts.get("customer_id") or get_or_create_customer(email=email, name=name)
-            facts["customer_id"] = customer_id
+            customer_id = facts.customer_id or get_or_create_customer(email=email, name=name)
+            facts.customer_id = customer_id
             tid, created = _create_or_append_ticket(customer_id, order_id, last_code, pending_msg, "chat")
-            facts.pop("pending_issue_text", None)
+            facts.pending_issue_text = None
             return (f"{'Created' if created else 'Updated'} ticket #{tid} for Order {order_id}. We’ll follow up shortly."), tid
         if _mark("ask_issue_after_bare_ordl") >= 2:
             return ("We have your Order ID. Tell me what happened (defective/wrong/missing item, "
@@ -368,58 +684,59 @@ def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name
                 "damaged, late delivery, or something else?"), None
 
     # Guard manuals when touching orders
-    touching_order = bool(ORDER_TOKEN_RE.search(user_text)) or bool(order_id)
-    route = None if touching_order else _manual_route(user_text)
+    # Any ORDL token in this message was already picked up by detect_intent into order_id.
+    touching_order = bool(order_id)
+    # The keyword shortcut must not take over ticket/FAQ messages that merely mention "specs" etc.
+    route = None if touching_order else _manual_route(user_text, local=intent.type == "fallback")
 
     if route and route.get("section") and float(route.get("confidence", 0.0)) >= 0.6:
         sec  = (route["section"] or "").lower().strip()
-        prod = (route.get("product") or facts.get("last_manual_product"))
+        prod = (route.get("product") or facts.last_manual_product)
         if sec in {"specs","technical_specs","technical specs"}: sec = "tech_specs"
         if not prod:
             return (f"Sure — {sec.replace('_',' ')}. Which product is this for? Please tell me the product name."), None
 
         section_md = get_manual_fuzzy(prod, sec)
         if not section_md:
-            full_md = getattr(llm, "generate_manual_md")(prod, facts.get("manual_facts", {}))
-            section_md = getattr(llm, "extract_manual_section")(full_md, sec)
-            upsert_manual(prod, sec, section_md, facts=facts.get("manual_facts", {}))
-            session["facts"]["last_manual_md"] = full_md
+            full_md = llm.generate_manual_md(prod, facts.manual_facts or {})
+            section_md = llm.extract_manual_section(full_md, sec)
+            upsert_manual(prod, sec, section_md, facts=facts.manual_facts or {})
+            facts.last_manual_md = full_md
 
         if sec == "tech_specs":
-            subset = _extract_specs_subset(section_md, user_text, session["facts"].get("manual_facts"))
+            subset = _extract_specs_subset(section_md, user_text, facts.manual_facts)
             if subset: section_md = subset
 
-        session["facts"]["last_manual_product"] = prod
-        if len(section_md) > 1500:
-            section_md = section_md[:1500].rstrip() + "\n\n…(truncated) Say “send full guide” for the complete manual."
+        facts.last_manual_product = prod
+        section_md = _truncate_md(section_md, 1500, "\n\n…(truncated) Say “send full guide” for the complete manual.")
         return section_md, None
 
-    if user_text.strip().lower() in {"send full guide","full manual","full user guide"}:
-        md = session["facts"].get("last_manual_md")
+    if tl in {"send full guide","full manual","full user guide"}:
+        md = facts.last_manual_md
         if not md:
             return "I don’t have a generated guide yet. Ask me like “user guide for <product>”.", None
-        product = session["facts"].get("last_manual_product") or "your product"
-        out = md if len(md) <= 3500 else (md[:3500].rstrip() + "\n\n…(truncated)")
+        product = facts.last_manual_product or "your product"
+        out = _truncate_md(md, 3500, "\n\n…(truncated)")
         return f"# {product} — User Guide\n\n{out}", None
 
     # Ensure customer id
-    customer_id = facts.get("customer_id")
+    customer_id = facts.customer_id
     if not customer_id:
         customer_id = get_or_create_customer(email=email, name=name)
-        facts["customer_id"] = customer_id
+        facts.customer_id = customer_id
 
     # Explicit ticket-open phrasing
-    if any(tok in tl for tok in OPEN_TICKET_TOKENS):
-        issue_code = facts.get("last_issue_code") or "GENERAL_QUERY"
-        tid, _ = _create_or_append_ticket(customer_id, facts.get("order_id"), issue_code, user_text, "chat")
+    if _has_any(tl, OPEN_TICKET_TOKENS):
+        issue_code = facts.last_issue_code or "GENERAL_QUERY"
+        tid, _ = _create_or_append_ticket(customer_id, facts.order_id, issue_code, user_text, "chat")
         return (f"Done — I’ve opened ticket #{tid}"
-                + (f" for Order {facts.get('order_id')}." if facts.get("order_id") else ".")
+                + (f" for Order {facts.order_id}." if facts.order_id else ".")
                 + " We’ll follow up shortly."), tid
 
     # Human escalation
     if intent.type == "human":
         if not (email and "@" in (email or "")):
-            facts["awaiting_human_email"] = True
+            facts.awaiting_human_email = True
             return "Sure — I’ll connect you to a human. Please share your email ID (e.g., name@example.com).", None
         tid, created = _create_or_append_ticket(customer_id, order_id, "HUMAN_ASSISTANCE", user_text, "chat")
         msg = "I’ve requested a human agent" if created else "I’ve added your request to your existing ticket"
@@ -428,8 +745,8 @@ def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name
     # Core issue intents
     if intent.type in ("defect","wrong_item","missing_item"):
         issue_code = "DEFECTIVE_ITEM" if intent.type == "defect" else "WRONG_ITEM" if intent.type == "wrong_item" else "MISSING_ITEM"
-        facts["last_issue_code"] = issue_code
-        facts["pending_issue_text"] = user_text
+        facts.last_issue_code = issue_code
+        facts.pending_issue_text = user_text
         if not order_id:
             if _mark("ask_ordl_for_ticketable") >= 2:
                 return ("I still don’t have an Order ID. I can connect you to a human right away. Would you like me to do that?"), None
@@ -438,31 +755,20 @@ def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name
         if not status:
             return f"I couldn’t find {order_id}. Please double-check the Order ID.", None
         if not is_allowed(issue_code, status):
-            pretty = issue_code.replace("_"," ").lower()
+            pretty = _pretty_issue(issue_code)
             return (f"Order {order_id} is **{status}**. Sorry, *{pretty}* isn’t available at this stage. "
                     "I can connect you to a human or suggest alternatives (e.g., return/refund where possible)."), None
         tid, created = _create_or_append_ticket(customer_id, order_id, issue_code, user_text, "chat")
-        facts.pop("pending_issue_text", None)
+        facts.pending_issue_text = None
         return f"Done! I’ve created ticket #{tid} for Order {order_id}. We’ll update you shortly.", tid
 
     # FAQ
     if intent.type == "faq":
-        hit = answer_faq_from_db(user_text)
-        raw_ans = hit[0] if hit else answer_faq(user_text)
-        if hit:
-            _, label = hit
-            facts["last_issue_code"] = normalize_issue(label)
-        else:
-            label = infer_issue_label_from_text(user_text)
-            facts["last_issue_code"] = normalize_issue(label)
-        polished = getattr(llm, "rewrite_answer", lambda u, b: None)(user_text, raw_ans) or raw_ans
-        return polished + "\n\nIf you’d like me to open a ticket for this, just say: “open a ticket for this issue”.", None
+        reply, facts.last_issue_code = _faq_reply(user_text, raw_lower)
+        return reply, None
 
     # If there is an order id but no issue yet
-    if intent.type == "fallback" and order_id and not any(k in tl for k in (
-        "defect","broken","damaged","wrong","missing","not received","partial","refund","return","exchange",
-        "payment","charged","debited","invoice","tracking","cancel","address","size","warranty"
-    )):
+    if intent.type == "fallback" and order_id and not _has_any(tl, ISSUE_HINT_TOKENS):
         if _mark("ask_issue_after_ordl") >= 2:
             return ("We can take this forward with a human or you can quickly tell me the issue "
                     "(defective/wrong/missing, payment, refund/return, delivery/tracking, etc.)."), None
@@ -484,16 +790,16 @@ def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name
         return (f"{'Created' if created else 'Updated'} ticket #{tid}" + (f" for Order {order_id}." if order_id else ".")), tid
 
     # LLM fallback
-    llm_res = getattr(llm, "classify", lambda _: None)(user_text) or {}
+    llm_res = (_llm_classify(user_text) if _llm_classify else None) or {}
     if llm_res:
         llm_intent = llm_res.get("intent", "fallback")
         conf = float(llm_res.get("confidence", 0.0))
         if llm_res.get("order_id") and not order_id:
-            order_id = llm_res["order_id"]; facts["order_id"] = order_id
+            order_id = llm_res["order_id"]; facts.order_id = order_id
 
         if llm_intent == "human" and conf >= 0.7:
             if not (email and "@" in (email or "")):
-                facts["awaiting_human_email"] = True
+                facts.awaiting_human_email = True
                 return "Sure — I’ll connect you to a human. Please share your email ID (e.g., name@example.com).", None
             tid, created = _create_or_append_ticket(customer_id, order_id, "HUMAN_ASSISTANCE", user_text, "chat")
             msg = "I’ve requested a human agent" if created else "I’ve added your request to your existing ticket"
@@ -509,18 +815,17 @@ def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name
             if not status:
                 return f"I couldn’t find {order_id}. Please double-check the Order ID.", None
             if not is_allowed(code, status):
-                pretty = code.replace("_"," ").lower()
+                pretty = _pretty_issue(code)
                 return (f"Order {order_id} is **{status}** so *{pretty}* isn’t available now. "
                         "I can connect you to a human or suggest alternatives."), None
             tid, created = _create_or_append_ticket(customer_id, order_id, code, user_text, "chat")
             return (f"{'Created' if created else 'Updated'} ticket #{tid}" + (f" for Order {order_id}." if order_id else ".")), tid
 
         if llm_intent == "faq" and conf >= 0.6:
-            db = answer_faq_from_db(user_text)
-            ans, label = (db[0], db[1]) if db else (answer_faq(user_text), llm_res.get("issue_label") or "other")
-            facts["last_issue_code"] = normalize_issue(label)
-            rewriter = getattr(llm, "rewrite_answer", None)
-            polished = rewriter(user_text, ans) if callable(rewriter) else None
+            db = answer_faq_from_db(user_text, raw_lower)
+            ans, label = (db[0], db[1]) if db else (answer_faq(user_text, raw_lower), llm_res.get("issue_label") or "other")
+            facts.last_issue_code = normalize_issue(label)
+            polished = _llm_rewrite(user_text, ans) if _llm_rewrite else None
             return (polished or ans) + "\n\nIf you’d like me to open a ticket for this, just say so.", None
 
     # Generic help
@@ -533,19 +838,38 @@ def chat_turn(session_id: str, user_text: str, email: Optional[str] = None, name
     return generic, None
 
 # ----------------------------- Label Helper -----------------------------
-def infer_issue_label_from_text(t: str) -> str:
-    t = t.lower()
-    if "payment" in t or "debited" in t or "charged" in t or "transaction" in t: return "payment issues"
-    if "refund" in t: return "refund timelines"
-    if "return" in t or "exchange" in t: return "return policy"
-    if "delivery" in t or "shipping" in t: return "delivery time & shipping"
-    if "track" in t or "tracking" in t: return "order tracking"
-    if "cancel" in t: return "cancellation"
-    if "address" in t: return "address change"
-    if "cod" in t or "cash on delivery" in t: return "cash on delivery"
-    if "invoice" in t or "gst" in t or "bill" in t: return "invoice / gst"
-    if "warranty" in t: return "warranty"
-    if "size" in t or "fit" in t or "size chart" in t: return "size & fit"
-    if "missing" in t or "not received" in t or "partial" in t: return "missing / partial delivery"
-    if "damaged" in t or "broken" in t: return "damaged in transit"
-    return "other"
+# Same first-hit-wins ordering as the original if-chain.
+_ISSUE_LABEL_GROUPS = _first_group_table((
+    ("payment", ("payment","debited","charged","transaction")),
+    ("refund", ("refund",)),
+    ("returns", ("return","exchange")),
+    ("shipping", ("delivery","shipping")),
+    ("tracking", ("track","tracking")),
+    ("cancel", ("cancel",)),
+    ("address", ("address",)),
+    ("cod", ("cod","cash on delivery")),
+    ("invoice", ("invoice","gst","bill")),
+    ("warranty", ("warranty",)),
+    ("size", ("size","fit","size chart")),
+    ("missing", ("missing","not received","partial")),
+    ("damaged", ("damaged","broken")),
+))
+_ISSUE_LABELS = {
+    "payment": "payment issues",
+    "refund": "refund timelines",
+    "returns": "return policy",
+    "shipping": "delivery time & shipping",
+    "tracking": "order tracking",
+    "cancel": "cancellation",
+    "address": "address change",
+    "cod": "cash on delivery",
+    "invoice": "invoice / gst",
+    "warranty": "warranty",
+    "size": "size & fit",
+    "missing": "missing / partial delivery",
+    "damaged": "damaged in transit",
+}
+
+def infer_issue_label_from_text(t: str, text_lower: Optional[str] = None) -> str:
+    hit = _first_group(_ISSUE_LABEL_GROUPS, t.lower() if text_lower is None else text_lower)
+    return _ISSUE_LABELS[hit] if hit else "other"
@@ -1,8 +1,9 @@
 from db import init_db
-from agent import chat_turn
+from agent import chat_turn, warm_faq_cache
 
 def main():
     init_db()
+    warm_faq_cache()
     print("Cassie chat demo. Type 'quit' to exit.\n")
     session_id = "local_demo_session"   
 
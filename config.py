@@ -12,6 +12,8 @@ class Settings(BaseSettings):
     TIMEZONE: str = "Asia/Kolkata"
     BRAND_NAME: str = "Cassie"
     BRAND_HOURS: str = "Mon–Fri 9:00–17:00"
+    SESSION_CACHE_MAX: int = 10_000
+    SESSION_TTL_SECONDS: int = 3600
     GROQ_API_KEY: Optional[str] = Field(
         default=None,
         validation_alias=AliasChoices("GROQ_API_KEY", "groq_api_key")
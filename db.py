@@ -1,5 +1,6 @@
 # db.py
 import sqlite3
+import threading
 from contextlib import contextmanager
 from typing import Iterator, Optional
 from config import settings
@@ -15,19 +16,64 @@ def _rows(conn, sql, params=()):
 def _day(date_str: str) -> str:
     return date_str[:10] if date_str else None
 
+# journal_mode=WAL is stored in the database file, so it only needs setting once per process;
+# the other pragmas are per-connection.
+_wal_enabled = False
+
+def _tune(conn: sqlite3.Connection) -> None:
+    global _wal_enabled
+    if not _wal_enabled:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _wal_enabled = True
+    conn.execute("PRAGMA synchronous=NORMAL")      # safe with WAL; fsync at checkpoints only
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")       # ~64 MB page cache
+    conn.execute("PRAGMA mmap_size=268435456")     # 256 MB
+
+def _connect() -> sqlite3.Connection:
+    # room for every report shape (each filter combination is its own SQL string)
+    conn = sqlite3.connect(settings.DATABASE_URL, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    _tune(conn)
+    return conn
+
+# One long-lived connection per thread, so SQLite's page cache survives between calls.
+_local = threading.local()
+
 @contextmanager
 def get_conn() -> Iterator[sqlite3.Connection]:
-    conn = sqlite3.connect(settings.DATABASE_URL)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.busy:
+        # nested inside another get_conn() on this thread: keep it an independent connection
+        conn = _connect()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+        return
+    if conn is None:
+        conn = _local.conn = _connect()
+    _local.busy = True
     try:
         yield conn
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     finally:
-        conn.close()
+        _local.busy = False
+
+# Bump whenever init_db() changes the schema; an up-to-date database skips the migration entirely.
+SCHEMA_VERSION = 4
 
 def init_db():
     with get_conn() as conn:
         c = conn.cursor()
+        if c.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            return
+        # one transaction for all DDL + seed; get_conn() commits it on exit
+        c.execute("BEGIN IMMEDIATE")
 
         c.execute("""
         CREATE TABLE IF NOT EXISTS customers (
@@ -65,6 +111,14 @@ def init_db():
         add("gmail_was_unread", "INTEGER")
         add("priority", "TEXT") 
 
+        # report filters (created_utc ranges + status/priority/source) and open-ticket-by-order lookups
+        # (created_utc, status|priority) already serve plain created_utc ranges
+        c.execute("DROP INDEX IF EXISTS idx_tickets_created")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tickets_created_status ON tickets(created_utc, status)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tickets_created_priority ON tickets(created_utc, priority)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tickets_source_created ON tickets(source, created_utc)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tickets_customer_order ON tickets(customer_id, order_id)")
+
         c.execute("""
         CREATE TABLE IF NOT EXISTS messages (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -106,7 +160,19 @@ def init_db():
             created_utc TEXT DEFAULT (datetime('now'))
         )""")
 
-        conn.commit()
+        # generated product manuals (manual.py also writes facts_json if that column exists)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS manual (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product TEXT NOT NULL,
+            section TEXT NOT NULL,
+            markdown TEXT NOT NULL,
+            updated_utc TEXT DEFAULT (datetime('now')),
+            UNIQUE(product, section)
+        )""")
+
+        c.execute("ANALYZE tickets")
+        c.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
 
 def get_order_status(order_id: str) -> Optional[str]:
     with get_conn() as conn:
@@ -115,12 +181,33 @@ def get_order_status(order_id: str) -> Optional[str]:
         row = cur.fetchone()
         return row["status"] if row else None
 
+# ---------------- reporting: shared connection ----------------
+@contextmanager
+def report_session() -> Iterator[sqlite3.Connection]:
+    """
+    One connection and one read snapshot for a batch of reports, e.g. a dashboard refresh:
+        with report_session() as conn:
+            summary = report_summary(start, end, conn=conn)
+            aging = report_aging_buckets(start, end, conn=conn)
+    """
+    with get_conn() as conn:
+        conn.execute("BEGIN")
+        yield conn
+
+@contextmanager
+def _report_conn(conn: Optional[sqlite3.Connection]) -> Iterator[sqlite3.Connection]:
+    if conn is not None:
+        yield conn
+    else:
+        with get_conn() as own:
+            yield own
+
 # ---------------- reporting: summary ----------------
-def report_summary(start_utc: str, end_utc: str) -> dict:
+def report_summary(start_utc: str, end_utc: str, *, conn: Optional[sqlite3.Connection] = None) -> dict:
     """
     Counts and aggregates between [start_utc, end_utc] (ISO UTC).
     """
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         params = (start_utc, end_utc)
 
         total = _scalar(conn,
@@ -203,48 +290,48 @@ def _where_from_filters(start_utc, end_utc, status=None, priority=None, channel=
         params.append(customer_email)
     return " WHERE " + " AND ".join(clauses), tuple(params)
 
-def report_summary_filtered(start_utc, end_utc, **filters):
+def report_summary_filtered(start_utc, end_utc, *, conn=None, **filters):
     where, params = _where_from_filters(start_utc, end_utc, **filters)
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         total = conn.execute(f"SELECT COUNT(*) FROM tickets {where}", params).fetchone()[0]
         by_status = [dict(r) for r in conn.execute(f"SELECT status, COUNT(*) AS count FROM tickets {where} GROUP BY status", params)]
         by_issue  = [dict(r) for r in conn.execute(f"SELECT issue_type, COUNT(*) AS count FROM tickets {where} GROUP BY issue_type", params)]
     return {"total": total, "by_status": by_status, "by_issue_type": by_issue}
 
-def report_status_breakdown(start_utc, end_utc, **filters):
+def report_status_breakdown(start_utc, end_utc, *, conn=None, **filters):
     where, params = _where_from_filters(start_utc, end_utc, **filters)
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         rows = conn.execute(f"SELECT status, COUNT(*) AS count FROM tickets {where} GROUP BY status", params).fetchall()
     return [dict(r) for r in rows]
 
-def report_priority_breakdown(start_utc, end_utc, **filters):
+def report_priority_breakdown(start_utc, end_utc, *, conn=None, **filters):
     where, params = _where_from_filters(start_utc, end_utc, **filters)
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         rows = conn.execute(
             f"SELECT COALESCE(priority,'P2') AS priority, COUNT(*) AS count FROM tickets {where} GROUP BY priority",
             params
         ).fetchall()
     return [dict(r) for r in rows]
 
-def report_channel_breakdown(start_utc, end_utc, **filters):
+def report_channel_breakdown(start_utc, end_utc, *, conn=None, **filters):
     where, params = _where_from_filters(start_utc, end_utc, **filters)
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         rows = conn.execute(
             f"SELECT COALESCE(source,'chat') AS channel, COUNT(*) AS count FROM tickets {where} GROUP BY channel",
             params
         ).fetchall()
     return [dict(r) for r in rows]
 
-def report_daily_counts(start_utc, end_utc, **filters):
+def report_daily_counts(start_utc, end_utc, *, conn=None, **filters):
     where, params = _where_from_filters(start_utc, end_utc, **filters)
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         rows = conn.execute(
             f"SELECT substr(created_utc,1,10) AS day, COUNT(*) AS count FROM tickets {where} GROUP BY day ORDER BY day",
             params
         ).fetchall()
     return [dict(r) for r in rows]
 
-def report_aging_buckets(start_utc, end_utc, **filters):
+def report_aging_buckets(start_utc, end_utc, *, conn=None, **filters):
     where, params = _where_from_filters(start_utc, end_utc, **filters)
     q = (
         f"SELECT CASE "
@@ -256,13 +343,13 @@ def report_aging_buckets(start_utc, end_utc, **filters):
         f"GROUP BY bucket "
         f"ORDER BY CASE bucket WHEN '0-24h' THEN 1 WHEN '24-48h' THEN 2 WHEN '48-72h' THEN 3 ELSE 4 END"
     )
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         rows = conn.execute(q, params).fetchall()
     return [dict(r) for r in rows]
 
-def report_oldest_open(start_utc, end_utc, limit=10, **filters):
+def report_oldest_open(start_utc, end_utc, limit=10, *, conn=None, **filters):
     where, params = _where_from_filters(start_utc, end_utc, **filters)
     q = f"SELECT id, order_id, created_utc FROM tickets {where} AND COALESCE(status,'open') != 'closed' ORDER BY created_utc ASC LIMIT ?"
-    with get_conn() as conn:
+    with _report_conn(conn) as conn:
         rows = conn.execute(q, params + (limit,)).fetchall()
     return [dict(r) for r in rows]
@@ -6,7 +6,7 @@ from flask import Flask, request, jsonify
 from zoneinfo import ZoneInfo
 from config import settings
 from db import (init_db, get_conn, report_summary, utc_range_for,)
-from agent import (chat_turn, compose_comment_reply, refresh_faq_cache,)
+from agent import (chat_turn, compose_comment_reply, refresh_faq_cache, warm_faq_cache,)
 from llm import classify, generate_manual_md, extract_manual_section
 from manual import upsert_manual, get_manual, get_manual_fuzzy, _facts_to_markdown  # use facts→markdown when needed
 from ticketing import get_ticket, set_status, get_or_create_customer, create_ticket, append_message, find_open_ticket_by_order
@@ -399,4 +399,5 @@ def manual_get():
 
 if __name__ == "__main__":
     init_db()
+    warm_faq_cache()
     app.run(host="127.0.0.1", port=5000, debug=True)
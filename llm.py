@@ -1,16 +1,21 @@
 import re, json
-from typing import Dict, Any, Optional
-from groq import Groq
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Any, Optional
 from config import settings
 
-_client: Optional[Groq] = None
-def _get_client() -> Optional[Groq]:
+if TYPE_CHECKING:
+    from groq import Groq
+
+_client: Optional["Groq"] = None
+def _get_client() -> Optional["Groq"]:
     global _client
     if _client is not None:
         return _client
     key = settings.GROQ_API_KEY
     if not key:
         return None
+    # The SDK (and its HTTP stack) is imported on first use, not at process start.
+    from groq import Groq
     _client = Groq(api_key=key)
     return _client
 
@@ -37,25 +42,33 @@ def classify(text: str) -> Dict[str, Any]:
     if client is None:
         return {"intent": "fallback", "order_id": None, "issue_label": None, "confidence": 0.0}
     try:
-        resp = client.chat.completions.create(
-            model="openai/gpt-oss-20b",
-            temperature=0.0,
-            messages=[
-                {"role": "system", "content": _SYSTEM},
-                {"role": "user", "content": text},
-            ],
-        )
-        raw = resp.choices[0].message.content or "{}"
-        data = _extract_json(raw)
-        return {
-            "intent": data.get("intent", "fallback"),
-            "order_id": data.get("order_id"),
-            "issue_label": data.get("issue_label"),
-            "confidence": float(data.get("confidence", 0.0)),
-        }
+        return dict(_classify_remote(text))
     except Exception:
         return {"intent": "fallback", "order_id": None, "issue_label": None, "confidence": 0.0}
 
+# temperature=0, so a repeated message gets the same answer: skip the round-trip.
+# Failures (including unparseable output) raise and are therefore never cached.
+@lru_cache(maxsize=512)
+def _classify_remote(text: str) -> Dict[str, Any]:
+    resp = _get_client().chat.completions.create(
+        model="openai/gpt-oss-20b",
+        temperature=0.0,
+        messages=[
+            {"role": "system", "content": _SYSTEM},
+            {"role": "user", "content": text},
+        ],
+    )
+    raw = resp.choices[0].message.content or "{}"
+    data = _extract_json(raw)
+    if not data or "intent" not in data:
+        raise ValueError(f"unusable classify output: {raw[:200]!r}")
+    return {
+        "intent": data.get("intent", "fallback"),
+        "order_id": data.get("order_id"),
+        "issue_label": data.get("issue_label"),
+        "confidence": float(data.get("confidence", 0.0)),
+    }
+
 
 _SYSTEM_REWRITE = """You are a helpful ecommerce support assistant.
 You will receive:
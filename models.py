@@ -1,8 +1,25 @@
 from dataclasses import dataclass
 from typing import Optional
 
-@dataclass
+# Frozen: detect_intent is memoized, so instances are shared between callers.
+@dataclass(frozen=True, slots=True)
 class DetectedIntent:
     type: str                  
     order_id: Optional[str]    
     issue_summary: Optional[str]
+
+@dataclass(slots=True)
+class SessionFacts:
+    """Per-chat state carried between turns (see agent.SESSION_CACHE)."""
+    order_id: Optional[str] = None
+    customer_id: Optional[int] = None
+    contact_email: Optional[str] = None
+    awaiting_human_email: bool = False
+    last_issue_code: Optional[str] = None
+    pending_issue_text: Optional[str] = None
+    last_manual_product: Optional[str] = None
+    last_manual_md: Optional[str] = None
+    manual_facts: Optional[dict] = None
+    # last repeated reply and how many times in a row it was given
+    repeat_key: Optional[str] = None
+    repeat_count: int = 0
@@ -1,3 +1,5 @@
+import threading
+from collections import OrderedDict
 from typing import Optional
 from db import get_conn
 from datetime import datetime, timezone
@@ -23,19 +25,40 @@ def set_ticket_email_meta(ticket_id: int, **meta) -> None:
     with get_conn() as conn:
         conn.execute(f"UPDATE tickets SET {', '.join(cols)}, updated_utc=? WHERE id=?", vals)
 
+# email -> customer id, least recently used first. Customer rows are never deleted, so a
+# known email keeps its id; the bound stops long-running workers (gmail_ack) growing it forever.
+_CUSTOMER_IDS_MAX = 4096
+_CUSTOMER_IDS: "OrderedDict[str, int]" = OrderedDict()
+_CUSTOMER_IDS_LOCK = threading.Lock()
+
 def get_or_create_customer(email: Optional[str], name: Optional[str] = None) -> int:
+    if email:
+        with _CUSTOMER_IDS_LOCK:
+            cid = _CUSTOMER_IDS.get(email)
+            if cid is not None:
+                _CUSTOMER_IDS.move_to_end(email)
+                return cid
     with get_conn() as conn:
         c = conn.cursor()
         if email:
             c.execute("SELECT id FROM customers WHERE email = ?", (email,))
             row = c.fetchone()
             if row:
-                return row["id"]
-            c.execute("INSERT INTO customers(email, name) VALUES(?,?)", (email, name))
-            return c.lastrowid
+                cid = row["id"]
+            else:
+                c.execute("INSERT INTO customers(email, name) VALUES(?,?)", (email, name))
+                cid = c.lastrowid
         else:
+            # anonymous: a new customer every time, nothing to cache
             c.execute("INSERT INTO customers(email, name) VALUES(?,?)", (None, name))
             return c.lastrowid
+    # remembered only once the insert above has committed
+    with _CUSTOMER_IDS_LOCK:
+        _CUSTOMER_IDS[email] = cid
+        _CUSTOMER_IDS.move_to_end(email)
+        if len(_CUSTOMER_IDS) > _CUSTOMER_IDS_MAX:
+            _CUSTOMER_IDS.popitem(last=False)
+    return cid
 
 def create_ticket(
     customer_id: int,